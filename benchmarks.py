@@ -0,0 +1,152 @@
+import argparse
+import gc
+import json
+import time
+from entities import *
+from caches import manager
+import generators
+import reducers
+from generators import terms
+from reducers import normalize, inductively_equal, church
+
+# Benchmarks
+# Every run of a benchmark starts from empty memo tables and enumeration
+# levels. As with timeit.autorange, each repetition runs a benchmark until a
+# minimum total time has passed, so that benchmarks taking well under a
+# millisecond are run hundreds of times, and the best run is reported, which
+# other processes slow down the least. Results can be saved as a baseline
+# and later runs compared against it.
+
+natural = BaseType('ℕ')
+
+context = (
+	(Constant('zero'), natural),
+	(Constant('succ'), FunctionType(natural, natural)),
+	(Constant('iter'), FunctionType(natural, FunctionType(FunctionType(natural, natural), FunctionType(natural, natural))))
+)
+
+def reset():
+	'''Clears every memo table, including pinned ones, the enumeration levels and the proven equivalences.
+	The interning tables of nodes are left alone, as nodes still alive must stay
+	unique, but they hold nodes weakly, so those only these tables referred to
+	are freed.'''
+	for cache in manager.caches:
+		cache.clear()
+	generators.levels.clear()
+	generators.normal_levels.clear()
+	generators.goal_levels.clear()
+	generators.undecided.clear()
+	reducers.equivalences.clear()
+
+def enumeration(steps):
+	return lambda: terms(context, steps)
+
+def addition(n, m):
+	term = Application(Application(Application(Constant('iter'), church(n)), Constant('succ')), church(m))
+	return lambda: normalize(term)
+
+def multiplication(n, m):
+	term = Application(
+		Application(
+			Application(Constant('iter'), church(n)),
+			Application(Application(Constant('iter'), church(m)), Constant('succ'))
+		),
+		Constant('zero')
+	)
+	return lambda: normalize(term)
+
+# (λ:ℕ (((iter 0) succ) zero)) = (λ:ℕ 0)
+identity = (
+	Abstraction(natural, Application(Application(Application(Constant('iter'), Variable(0)), Constant('succ')), Constant('zero'))),
+	Abstraction(natural, Variable(0)),
+	FunctionType(natural, natural),
+)
+
+# (λ:ℕ ((iter 0) succ)) = (λ:ℕ (λ:ℕ (((iter 0) succ) 1)))
+commutativity = (
+	Abstraction(natural, Application(Application(Constant('iter'), Variable(0)), Constant('succ'))),
+	Abstraction(natural, Abstraction(natural, Application(Application(Application(Constant('iter'), Variable(0)), Constant('succ')), Variable(1)))),
+	FunctionType(natural, FunctionType(natural, natural)),
+)
+
+# (λ:ℕ (succ 0)) ≠ (λ:ℕ 0)
+successor = (
+	Abstraction(natural, Application(Constant('succ'), Variable(0))),
+	Abstraction(natural, Variable(0)),
+	FunctionType(natural, natural),
+)
+
+def equality(pair, expected):
+	f, g, t = pair
+	def run():
+		assert inductively_equal(f, t, g, t) == expected
+	return run
+
+benchmarks = {
+	**{'enumeration/{}'.format(steps): enumeration(steps) for steps in range(3, 7)},
+	**{'normalization/add/{}'.format(n): addition(n, n) for n in (10, 20, 40, 80)},
+	**{'normalization/multiply/{}'.format(n): multiplication(n, n) for n in (5, 10, 15)},
+	'inductively_equal/identity': equality(identity, True),
+	'inductively_equal/commutativity': equality(commutativity, True),
+	'inductively_equal/successor': equality(successor, False),
+}
+
+# Minimum total time in seconds of the runs of a repetition
+minimum = 0.2
+
+def measure(benchmark, repeat):
+	'''Best wall time of a cold run of a benchmark, over several repetitions of at least the minimum time each'''
+	times = []
+	for _ in range(repeat):
+		total = 0
+		while total < minimum:
+			reset()
+			# As in timeit, garbage collection is kept out of the timed runs
+			gc.collect()
+			gc.disable()
+			try:
+				start = time.perf_counter()
+				benchmark()
+				elapsed = time.perf_counter() - start
+			finally:
+				gc.enable()
+			times.append(elapsed)
+			total += elapsed
+	return min(times)
+
+def main():
+	parser = argparse.ArgumentParser(description='Run the benchmark suite')
+	parser.add_argument('--repeat', type=int, default=3)
+	parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+	parser.add_argument('--save', metavar='FILE', help='store the results as a baseline')
+	parser.add_argument('--compare', metavar='FILE', help='compare the results against a baseline')
+	parser.add_argument('--tolerance', type=float, default=0.1, help='relative slowdown reported as a regression')
+	arguments = parser.parse_args()
+
+	baseline = {}
+	if arguments.compare:
+		with open(arguments.compare) as file:
+			baseline = json.load(file)
+
+	results = {}
+	regressions = 0
+	for name, benchmark in benchmarks.items():
+		if arguments.filter not in name:
+			continue
+		results[name] = measure(benchmark, arguments.repeat)
+		line = '{:40} {:10.4f}s'.format(name, results[name])
+		if name in baseline:
+			ratio = results[name] / baseline[name]
+			line += ' {:10.4f}s {:6.2f}x'.format(baseline[name], ratio)
+			if ratio > 1 + arguments.tolerance:
+				line += ' regression'
+				regressions += 1
+		print(line, flush=True)
+
+	if arguments.save:
+		with open(arguments.save, 'w') as file:
+			json.dump(results, file, indent='\t', sort_keys=True)
+	return 1 if regressions else 0
+
+if __name__ == '__main__':
+	exit(main())
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from functools import update_wrapper
+import os
+
+# Memo tables
+# Every memoized function registers its table with a central manager. Each
+# table can be given a budget on its number of entries, beyond which its
+# least recently used entries are evicted. The manager also enforces a
+# ceiling on resident memory by clearing tables in order of priority:
+# transient reduction intermediates first, then derived tables, while
+# pinned tables (such as the enumeration levels) are never evicted. Nodes
+# are held weakly by their interning tables, so those that only the cleared
+# tables referred to are freed along with them. Freed memory is not always
+# returned to the system, so after a clear that leaves resident memory above
+# the ceiling, tables are not cleared again until it has grown by a slack
+# factor beyond what that clear left.
+
+TRANSIENT = 0
+DERIVED = 1
+PINNED = 2
+
+class Cache:
+	'''Memo table of a function, evicting its least recently used entries beyond a budget'''
+	def __init__(self, function, priority, maxsize=None):
+		self.function = function
+		self.priority = priority
+		self.maxsize = None
+		self.entries = {}
+		self.hits = 0
+		self.misses = 0
+		self.resize(maxsize)
+	def resize(self, maxsize):
+		'''Sets the budget of the table, evicting least recently used entries beyond it'''
+		# Unbounded tables are plain dicts, which are faster than ordered ones
+		self.maxsize = maxsize
+		if maxsize is None:
+			self.entries = dict(self.entries)
+			return
+		if not isinstance(self.entries, OrderedDict):
+			self.entries = OrderedDict(self.entries)
+		while len(self.entries) > maxsize:
+			self.entries.popitem(last=False)
+	def get(self, key, default=None):
+		'''Looks up a result stored under a tuple of arguments'''
+		return self.entries.get(key, default)
+	def put(self, key, value):
+		'''Stores a result under a tuple of arguments, such as one found while computing another'''
+		self.entries[key] = value
+		if self.maxsize is not None and len(self.entries) > self.maxsize:
+			self.entries.popitem(last=False)
+	def clear(self):
+		self.entries.clear()
+		self.hits = 0
+		self.misses = 0
+	def info(self):
+		return {
+			'name': '{}.{}'.format(self.function.__module__, self.function.__qualname__),
+			'hits': self.hits,
+			'misses': self.misses,
+			'size': len(self.entries),
+			'maxsize': self.maxsize,
+		}
+
+missing = object()
+
+def memoized(cache):
+	'''Wraps the function of a cache so that calls go through its table'''
+	function = cache.function
+	def wrapper(*arguments, **keywords):
+		key = arguments + tuple(keywords.items()) if keywords else arguments
+		entries = cache.entries
+		value = entries.get(key, missing)
+		if value is missing:
+			cache.misses += 1
+			value = function(*arguments, **keywords)
+			entries[key] = value
+			if cache.maxsize is not None and len(entries) > cache.maxsize:
+				entries.popitem(last=False)
+			manager.countdown -= 1
+			if manager.countdown <= 0:
+				manager.check()
+			return value
+		cache.hits += 1
+		if cache.maxsize is not None:
+			entries.move_to_end(key)
+		return value
+	update_wrapper(wrapper, function)
+	wrapper.cache = cache
+	wrapper.cache_clear = cache.clear
+	wrapper.cache_info = cache.info
+	return wrapper
+
+def resident_memory():
+	'''Resident set size of this process in bytes, or None if it cannot be measured'''
+	try:
+		with open('/proc/self/statm') as file:
+			return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (OSError, ValueError, IndexError):
+		return None
+
+class Manager:
+	'''Registry of memo tables, enforcing their budgets and a global memory ceiling'''
+	def __init__(self):
+		self.caches = []
+		self.budgets = {}
+		self.ceiling = None
+		self.interval = 1 << 14
+		self.countdown = self.interval
+		self.slack = 1.5
+		self.threshold = None
+	def register(self, cache):
+		self.caches.append(cache)
+		if cache.function.__qualname__ in self.budgets:
+			cache.resize(self.budgets[cache.function.__qualname__])
+	def budget(self, name, maxsize):
+		'''Limits the number of entries of the named tables, including ones registered later'''
+		self.budgets[name] = maxsize
+		for cache in self.caches:
+			if cache.function.__qualname__ == name:
+				cache.resize(maxsize)
+	def limit(self, ceiling, interval=1 << 14, slack=1.5):
+		'''Sets a ceiling in bytes on resident memory, checked every given number of insertions,
+		and the factor by which memory must grow after an ineffective clear before the next one'''
+		self.ceiling = ceiling
+		self.interval = interval
+		self.countdown = interval
+		self.slack = slack
+		self.threshold = None
+	def check(self):
+		self.countdown = self.interval
+		if self.ceiling is not None:
+			self.enforce()
+	def enforce(self):
+		'''Clears tables in order of priority until resident memory is below the ceiling'''
+		memory = resident_memory()
+		if memory is None or memory <= self.ceiling:
+			self.threshold = None
+			return
+		if self.threshold is not None and memory <= self.threshold:
+			return
+		for priority in (TRANSIENT, DERIVED):
+			for cache in self.caches:
+				if cache.priority == priority:
+					cache.entries.clear()
+			memory = resident_memory()
+			if memory <= self.ceiling:
+				self.threshold = None
+				return
+		self.threshold = memory * self.slack
+	def info(self):
+		return [cache.info() for cache in self.caches]
+	def clear(self):
+		for cache in self.caches:
+			if cache.priority != PINNED:
+				cache.clear()
+
+manager = Manager()
+
+def memoize(priority=DERIVED, maxsize=None):
+	'''Decorator that memoizes a function in a table registered with the manager'''
+	def decorator(function):
+		cache = Cache(function, priority, maxsize)
+		manager.register(cache)
+		return memoized(cache)
+	return decorator
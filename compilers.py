@@ -0,0 +1,63 @@
+from entities import *
+from caches import memoize, TRANSIENT, DERIVED
+
+# Compilation to Python closures
+# Natural numbers are represented by ints, zero, succ and iter by native
+# integer operations, and abstractions by Python functions.
+
+def successor(n):
+	return n + 1
+
+def iterate(n):
+	def iterate_function(f):
+		def iterate_argument(x):
+			if f is successor:
+				return x + n
+			for _ in range(n):
+				x = f(x)
+			return x
+		return iterate_argument
+	return iterate_function
+
+constants = {
+	'zero': 0,
+	'succ': successor,
+	'iter': iterate,
+}
+
+def compile_node(term):
+	'''Translates the outermost node of a term, compiling its subterms'''
+	if isinstance(term, Constant):
+		if term.name not in constants:
+			raise Exception('Cannot compile constant: {}'.format(term))
+		value = constants[term.name]
+		return lambda environment: value
+	elif isinstance(term, Variable):
+		index = term.index
+		return lambda environment: environment[index]
+	elif isinstance(term, Abstraction):
+		body = compile_code(term.body)
+		return lambda environment: lambda x: body((x,) + environment)
+	elif isinstance(term, Application):
+		function = compile_code(term.function)
+		argument = compile_code(term.argument)
+		return lambda environment: function(environment)(argument(environment))
+
+@memoize(TRANSIENT)
+def compile_code(term):
+	'''Returns a function that evaluates a term in an environment tuple'''
+	assert isinstance(term, Term)
+	code = compile_node(term)
+	if term.bound == 0:
+		# Closed subterms are evaluated once
+		value = code(())
+		return lambda environment: value
+	return code
+
+@memoize(DERIVED)
+def compile_term(term):
+	'''Compiles a closed term into a Python callable over ints'''
+	assert isinstance(term, Term)
+	if term.bound != 0:
+		raise Exception('Cannot compile open term: {}'.format(term))
+	return compile_code(term)(())
@@ -0,0 +1,107 @@
+from collections import Counter
+from entities import *
+from caches import memoize, DERIVED
+from generators import types, terms, augment, functions, levels, keyed
+
+# Counting
+# The number of terms of each type the grammar of generators builds with a
+# given number of steps, computed by dynamic programming over types and step
+# budgets without building any term. Counts only depend on the multiset of
+# types in the context, which is the key of every table here.
+
+def signature(context):
+	'''Multiset of the types of a context'''
+	return frozenset(Counter(t for e, t in context).items())
+
+def extend(key, type):
+	'''Multiset of the types of a context augmented with a type'''
+	extended = Counter(dict(key))
+	extended[type] += 1
+	return frozenset(extended.items())
+
+def merge(total, counts):
+	for t, count in counts.items():
+		total[t] = total.get(t, 0) + count
+
+@memoize(DERIVED)
+def raw_abstractions(key, steps):
+	'''Number of abstractions of each type with the given number of steps, before deduplication'''
+	assert isinstance(steps, int) and steps >= 0
+	counts = {}
+	for n in range(steps):
+		for t in types(n):
+			for e_t, count in raw_counts(extend(key, t), steps - 1 - n).items():
+				abstraction_t = FunctionType(t, e_t)
+				counts[abstraction_t] = counts.get(abstraction_t, 0) + count
+	return counts
+
+@memoize(DERIVED)
+def raw_applications(key, steps):
+	'''Number of applications of each type with the given number of steps, before deduplication'''
+	assert isinstance(steps, int) and steps >= 0
+	counts = {}
+	for n in range(steps):
+		arguments = raw_counts(key, n)
+		for e1_t, count in raw_counts(key, steps - 1 - n).items():
+			if isinstance(e1_t, FunctionType) and e1_t.argument in arguments:
+				counts[e1_t.result] = counts.get(e1_t.result, 0) + count * arguments[e1_t.argument]
+	return counts
+
+@memoize(DERIVED)
+def raw_counts(key, steps):
+	'''Number of terms of each type with the given number of steps, before deduplication'''
+	assert isinstance(steps, int) and steps >= 0
+	if steps == 0:
+		return dict(key)
+	counts = {}
+	merge(counts, raw_abstractions(key, steps))
+	merge(counts, raw_applications(key, steps))
+	return counts
+
+def count(context, steps):
+	'''Number of terms of each type the grammar builds in a context with the given number of steps, before deduplication'''
+	return raw_counts(signature(context), steps)
+
+def raw_candidates(context, steps):
+	'''Numbers of abstractions and applications the grammar builds in a context with the given number of steps, before deduplication'''
+	key = signature(context)
+	return sum(raw_abstractions(key, steps).values()), sum(raw_applications(key, steps).values())
+
+def candidates(context, steps):
+	'''Exact numbers of abstractions and applications terms builds as candidates for a level,
+	computed from the lower levels (which are enumerated if needed) without building the level'''
+	assert isinstance(steps, int) and steps >= 0
+	if steps == 0:
+		return 0, 0
+	abstractions = sum(
+		len(terms(augment(context, t), steps - 1 - n))
+		for n in range(steps)
+		for t in types(n)
+	)
+	applications = sum(
+		len(functions(context, steps - 1 - n, e2_t))
+		for n in range(steps)
+		for e2, e2_t in terms(context, n)
+	)
+	return abstractions, applications
+
+def estimate(context, steps):
+	'''Estimated number of terms with the given number of steps after deduplication.
+	The fraction of candidates that survive deduplication is measured on the
+	levels of the context that are already enumerated and extrapolated
+	geometrically from the last two of them.'''
+	assert isinstance(steps, int) and steps >= 0
+	context = keyed(context)
+	if (context, steps) in levels:
+		return len(levels[context, steps])
+	known = [n for n in range(1, steps) if (context, n) in levels]
+	total = sum(count(context, steps).values())
+	if not known:
+		return total
+	def survival(n):
+		return len(levels[context, n]) / sum(count(context, n).values())
+	last = known[-1]
+	ratio = survival(last)
+	if len(known) > 1 and survival(known[-2]) > 0:
+		ratio *= (ratio / survival(known[-2])) ** ((steps - last) / (last - known[-2]))
+	return total * min(ratio, 1)
@@ -0,0 +1,162 @@
+from entities import *
+
+# E-graphs
+# Terms are added node by node into classes of equal terms, so that a term
+# shares the class of every subterm it has in common with the terms already
+# added. Only normal forms are added, those of the enumerated terms and the
+# two sides of equalities proven by induction, which are merged as lemmas.
+# Rebuilding restores congruence: applications and abstractions whose
+# children were merged are merged in turn, so a lemma propagates to every
+# term that contains one of its sides. Other terms are looked up without
+# being added, so the graph grows with the terms kept rather than with
+# every candidate.
+#
+# Classes are integers. A node is a leaf term, a pair (function, argument)
+# of classes for an application, or a pair (type, body) of a type and a
+# class for an abstraction, which a type and a class can never be confused
+# with.
+
+class EGraph:
+	'''Congruence-closed equivalence classes of terms'''
+	def __init__(self):
+		self.parents = []
+		self.nodes = {}
+		self.uses = []
+		self.terms = {}
+		self.representatives = {}
+		self.pending = []
+	def find(self, eclass):
+		parents = self.parents
+		root = eclass
+		while parents[root] != root:
+			root = parents[root]
+		while parents[eclass] != root:
+			parents[eclass], eclass = root, parents[eclass]
+		return root
+	def canonical(self, node):
+		if isinstance(node, tuple):
+			first, second = node
+			return (first if isinstance(first, Type) else self.find(first), self.find(second))
+		return node
+	def insert(self, node):
+		'''Class of a node whose children are canonical, creating it if needed'''
+		eclass = self.nodes.get(node)
+		if eclass is not None:
+			return self.find(eclass)
+		eclass = len(self.parents)
+		self.parents.append(eclass)
+		self.uses.append([])
+		self.nodes[node] = eclass
+		if isinstance(node, tuple):
+			for child in node:
+				if not isinstance(child, Type):
+					self.uses[child].append((node, eclass))
+		return eclass
+	def add(self, term):
+		'''Class of a term, adding its nodes that are not in the graph yet'''
+		assert isinstance(term, Term)
+		stack = [(term, False)]
+		results = []
+		while stack:
+			term, visited = stack.pop()
+			if term in self.terms:
+				results.append(self.find(self.terms[term]))
+				continue
+			if isinstance(term, Abstraction):
+				if visited:
+					eclass = self.insert((term.type, results.pop()))
+				else:
+					stack.append((term, True))
+					stack.append((term.body, False))
+					continue
+			elif isinstance(term, Application):
+				if visited:
+					argument = results.pop()
+					eclass = self.insert((results.pop(), argument))
+				else:
+					stack.append((term, True))
+					stack.append((term.argument, False))
+					stack.append((term.function, False))
+					continue
+			else:
+				eclass = self.insert(term)
+			self.terms[term] = eclass
+			results.append(eclass)
+		return results.pop()
+	def lookup(self, term):
+		'''Class of a term, or None if it is not in the graph, without adding it'''
+		assert isinstance(term, Term)
+		stack = [(term, False)]
+		results = []
+		while stack:
+			term, visited = stack.pop()
+			eclass = self.terms.get(term)
+			if eclass is None:
+				if isinstance(term, Abstraction):
+					if not visited:
+						stack.append((term, True))
+						stack.append((term.body, False))
+						continue
+					body = results.pop()
+					if body is not None:
+						eclass = self.nodes.get((term.type, body))
+				elif isinstance(term, Application):
+					if not visited:
+						stack.append((term, True))
+						stack.append((term.argument, False))
+						stack.append((term.function, False))
+						continue
+					argument = results.pop()
+					function = results.pop()
+					if function is not None and argument is not None:
+						eclass = self.nodes.get((function, argument))
+				else:
+					eclass = self.nodes.get(term)
+			results.append(None if eclass is None else self.find(eclass))
+		return results.pop()
+	def union(self, a, b):
+		'''Merges two classes, leaving congruence to be restored by rebuild'''
+		a = self.find(a)
+		b = self.find(b)
+		if a == b:
+			return a
+		if len(self.uses[a]) > len(self.uses[b]):
+			a, b = b, a
+		self.parents[a] = b
+		self.uses[b].extend(self.uses[a])
+		self.uses[a] = []
+		if b not in self.representatives and a in self.representatives:
+			self.representatives[b] = self.representatives[a]
+		self.pending.append(b)
+		return b
+	def rebuild(self):
+		'''Merges the parents of merged classes that have become congruent'''
+		while self.pending:
+			pending = {self.find(eclass) for eclass in self.pending}
+			self.pending = []
+			for eclass in pending:
+				self.repair(self.find(eclass))
+	def repair(self, eclass):
+		entries = self.uses[eclass]
+		self.uses[eclass] = []
+		uses = {}
+		for node, parent in entries:
+			self.nodes.pop(node, None)
+			node = self.canonical(node)
+			if node in uses:
+				self.union(parent, uses[node])
+			uses[node] = self.find(parent)
+		for node, parent in uses.items():
+			self.nodes[node] = self.find(parent)
+		self.uses[self.find(eclass)].extend(uses.items())
+	def equate(self, a, b):
+		'''Merges the classes of two terms proven equal'''
+		self.union(self.add(a), self.add(b))
+		self.rebuild()
+	def represent(self, term):
+		'''Records a term as the representative of its class, unless it already has one'''
+		self.representatives.setdefault(self.add(term), term)
+	def representative(self, term):
+		'''Representative of the class of a term, or None if it has none or is not in the graph'''
+		eclass = self.lookup(term)
+		return None if eclass is None else self.representatives.get(eclass)
@@ -1,3 +1,5 @@
+import weakref
+
 class Entity:
 	def __repr__(self):
 		return str(self)
@@ -6,13 +8,49 @@ class Entity:
 	def __hash__(self):
 		return hash(frozenset(self.__dict__.items()))
 
-class Type(Entity):
+class Interned(type):
+	'''Metaclass that hash-conses instances, so that structurally equal nodes are the same object.
+	The tables hold their nodes weakly: a node that is no longer referenced is
+	freed and dropped from its table, which is safe since only live nodes can
+	ever be compared.'''
+	def __init__(cls, name, bases, namespace):
+		super().__init__(name, bases, namespace)
+		cls.instances = weakref.WeakValueDictionary()
+	def __call__(cls, *arguments):
+		# Reads the weak references directly, as the lookup methods of the table are slow
+		reference = cls.instances.data.get(arguments)
+		instance = None if reference is None else reference()
+		if instance is None:
+			instance = super().__call__(*arguments)
+			instance.arguments = arguments
+			instance.hash = hash((cls, arguments))
+			cls.instances[arguments] = instance
+		return instance
+
+class Node(Entity, metaclass=Interned):
+	'''Interned entity that compares by identity and carries a precomputed hash'''
+	def __eq__(self, other):
+		return self is other
+	def __ne__(self, other):
+		return self is not other
+	def __hash__(self):
+		return self.hash
+	def __reduce__(self):
+		return (type(self), self.arguments)
+
+# Nodes carry metadata computed once at construction:
+# size: number of abstractions, applications and arrows, counting binder types
+# bound: one more than the greatest free variable index, or 0 if closed
+# nodes: number of abstractions and applications
+
+class Type(Node):
 	pass
 
 class BaseType(Type):
 	def __init__(self, name):
 		assert isinstance(name, str)
 		self.name = name
+		self.size = 0
 	def __str__(self):
 		return self.name
 
@@ -22,16 +60,20 @@ class FunctionType(Type):
 		assert isinstance(result, Type)
 		self.argument = argument
 		self.result = result
+		self.size = 1 + argument.size + result.size
 	def __str__(self):
 		return '({} → {})'.format(self.argument, self.result)
 
-class Term(Entity):
+class Term(Node):
 	pass
 
 class Constant(Term):
 	def __init__(self, name):
 		assert isinstance(name, str)
 		self.name = name
+		self.size = 0
+		self.bound = 0
+		self.nodes = 0
 	def __str__(self):
 		return self.name
 
@@ -41,6 +83,9 @@ class Application(Term):
 		assert isinstance(argument, Term)
 		self.function = function
 		self.argument = argument
+		self.size = 1 + function.size + argument.size
+		self.bound = max(function.bound, argument.bound)
+		self.nodes = 1 + function.nodes + argument.nodes
 	def __str__(self):
 		return '({} {})'.format(self.function, self.argument)
 
@@ -50,6 +95,9 @@ class Abstraction(Term):
 		assert isinstance(body, Term)
 		self.type = type
 		self.body = body
+		self.size = 1 + type.size + body.size
+		self.bound = max(body.bound - 1, 0)
+		self.nodes = 1 + body.nodes
 	def __str__(self):
 		return '(λ:{} {})'.format(self.type, self.body)
 
@@ -57,20 +105,16 @@ class Variable(Term):
 	def __init__(self, index):
 		assert isinstance(index, int) and index >= 0
 		self.index = index
+		self.size = 0
+		self.bound = index + 1
+		self.nodes = 0
 	def __str__(self):
 		return '{}'.format(self.index)
 
 def get_size(term):
 	'''Returns the number of abstractions and applications in a term'''
 	assert isinstance(term, Term)
-	if isinstance(term, Constant):
-		return 0
-	elif isinstance(term, Variable):
-		return 0
-	elif isinstance(term, Application):
-		return 1 + get_size(term.function) + get_size(term.argument)
-	elif isinstance(term, Abstraction):
-		return 1 + get_size(term.body)
+	return term.nodes
 
 class Context(Entity, dict):
 	def __init__(self, dictionary=dict()):
@@ -0,0 +1,136 @@
+from entities import *
+from caches import memoize, DERIVED
+from reducers import eta_reduce, natural
+
+# Normalization by evaluation
+# Terms are evaluated into a semantic domain of closures and neutral terms,
+# then read back into de Bruijn terms in a single pass.
+
+class Closure:
+	'''Abstraction paired with the environment it was evaluated in'''
+	__slots__ = ('type', 'body', 'environment')
+	def __init__(self, type, body, environment):
+		self.type = type
+		self.body = body
+		self.environment = environment
+
+class Neutral:
+	'''Head (a de Bruijn level or a constant) applied to a spine of values'''
+	__slots__ = ('head', 'arguments')
+	def __init__(self, head, arguments=()):
+		self.head = head
+		self.arguments = arguments
+
+# iter zero → λf λx x
+iter_zero = Abstraction(natural, Variable(0))
+
+# iter (succ i) → λf λx f (iter i f x), with i bound at index 2
+iter_succ = Abstraction(
+	natural,
+	Application(
+		Variable(1),
+		Application(
+			Application(
+				Application(
+					Constant('iter'),
+					Variable(2)
+				),
+				Variable(1)
+			),
+			Variable(0)
+		)
+	)
+)
+
+def lookup(environment, index):
+	'''Returns the value bound at a de Bruijn index in a linked environment'''
+	for _ in range(index):
+		environment = environment[1]
+	return environment[0]
+
+def evaluate(term, environment=None):
+	'''Evaluates a term into the semantic domain'''
+	# Explicit stack of pending arguments (term, environment) and of evaluated
+	# functions waiting for their argument (None, function), so that deep
+	# iter unfoldings do not recurse on the Python stack
+	stack = []
+	while True:
+		while isinstance(term, Application):
+			stack.append((term.argument, environment))
+			term = term.function
+		if isinstance(term, Variable):
+			value = lookup(environment, term.index)
+		elif isinstance(term, Constant):
+			value = Neutral(term)
+		elif isinstance(term, Abstraction):
+			value = Closure(term.type, term.body, environment)
+		while stack:
+			argument, argument_environment = stack.pop()
+			if argument is not None:
+				stack.append((None, value))
+				term, environment = argument, argument_environment
+				break
+			function = argument_environment
+			if isinstance(function, Closure):
+				term, environment = function.body, (value, function.environment)
+				break
+			value = apply(function, value)
+		else:
+			return value
+
+def apply(function, argument):
+	'''Applies a semantic value to another'''
+	if isinstance(function, Closure):
+		return evaluate(function.body, (argument, function.environment))
+	if function.head == Constant('iter') and not function.arguments and isinstance(argument, Neutral):
+		if argument.head == Constant('zero') and not argument.arguments:
+			return Closure(FunctionType(natural, natural), iter_zero, None)
+		elif argument.head == Constant('succ') and len(argument.arguments) == 1:
+			return Closure(FunctionType(natural, natural), iter_succ, (argument.arguments[0], None))
+	return Neutral(function.head, function.arguments + (argument,))
+
+def instantiate(closure, depth):
+	'''Value of the body of a closure with its variable bound to the de Bruijn level depth'''
+	return apply(closure, Neutral(depth))
+
+def read_back(value, depth, instantiate=instantiate, force=None):
+	'''Converts a semantic value into a term in normal form.
+	Closures are opened with instantiate and, if force is given, the
+	arguments of neutral terms are passed through it first, so that the
+	machine can read back its own closures and thunks.'''
+	# Explicit stack of values to read back and of the abstractions (type) and
+	# applications (number of arguments, head) to build from their results
+	stack = [(value, depth)]
+	results = []
+	while stack:
+		value, depth = stack.pop()
+		if isinstance(value, Closure):
+			stack.append((value.type, None))
+			stack.append((instantiate(value, depth), depth + 1))
+		elif isinstance(value, Neutral):
+			head = value.head if isinstance(value.head, Constant) else Variable(depth - 1 - value.head)
+			stack.append((head, len(value.arguments)))
+			for argument in reversed(value.arguments):
+				stack.append((argument if force is None else force(argument), depth))
+		elif isinstance(value, Type):
+			term = Abstraction(value, results.pop())
+			reduction = eta_reduce(term)
+			results.append(term if reduction is False else reduction)
+		else:
+			term, count = value, depth
+			arguments = results[len(results) - count:]
+			del results[len(results) - count:]
+			for argument in arguments:
+				term = Application(term, argument)
+			results.append(term)
+	return results.pop()
+
+@memoize(DERIVED)
+def normalize_by_evaluation(term):
+	'''Normal form of a term, computed by evaluation and read-back'''
+	assert isinstance(term, Term)
+	depth = term.bound
+	environment = None
+	for level in range(depth):
+		environment = (Neutral(level), environment)
+	return read_back(evaluate(term, environment), depth)
@@ -1,11 +1,23 @@
 from entities import *
-from functools import lru_cache
+import hashlib
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from caches import memoize, TRANSIENT, DERIVED, PINNED
+from itertools import chain, count, product
 from reducers import *
+import reducers
+from compilers import compile_term
+from egraphs import EGraph
+import metrics
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def increment(term):
 	assert isinstance(term, Term)
-	if isinstance(term, Variable):
+	if term.bound == 0:
+		return term
+	elif isinstance(term, Variable):
 		return Variable(term.index + 1)
 	elif isinstance(term, Application):
 		return Application(increment(term.function), increment(term.argument))
@@ -14,45 +26,238 @@ def increment(term):
 	elif isinstance(term, Constant):
 		return term
 
-@lru_cache(maxsize=None)
+class Extension(Node):
+	'''Context extended with a bound variable of a type, sharing the context it extends.
+	Extensions are interned, so extending a context is a single table lookup
+	and the extension hashes and compares in constant time. Its entries, with
+	the variables of the context it extends incremented, are only built when
+	it is iterated.'''
+	def __init__(self, base, type):
+		assert isinstance(type, Type)
+		self.base = base
+		self.type = type
+		self.entries = None
+	def __iter__(self):
+		if self.entries is None:
+			self.entries = ((Variable(0), self.type),) + tuple(
+				(increment(e), t)
+				for e, t in self.base
+			)
+		return iter(self.entries)
+	def __len__(self):
+		return 1 + len(self.base)
+	def __str__(self):
+		return str(tuple(self))
+
+class Budgeted(Node):
+	'''Context enumerated under a normalization budget of reducers.
+	Candidates that run out of the budget are left out of their level, and
+	equalities it cannot decide are not proven, so the levels of a context
+	depend on its budget. They are stored under this context instead, which
+	has the same entries as the context it wraps but is distinct from it and
+	from the same context under any other budget.'''
+	def __init__(self, base, fuel, deadline):
+		self.base = base
+		self.fuel = fuel
+		self.deadline = deadline
+	def __iter__(self):
+		return iter(self.base)
+	def __len__(self):
+		return len(self.base)
+	def __str__(self):
+		return str(tuple(self))
+
+def root(context):
+	'''Context that a context extends, through any number of extensions'''
+	while isinstance(context, Extension):
+		context = context.base
+	return context
+
+def keyed(context):
+	'''Context under which the levels of a context are stored with the current budget of reducers.
+	Contexts already under a budget, such as the extensions built while
+	enumerating them, are kept as they are.'''
+	if reducers.fuel is None and reducers.deadline is None:
+		return context
+	if isinstance(root(context), Budgeted):
+		return context
+	return Budgeted(context, reducers.fuel, reducers.deadline)
+
 def augment(context, type):
+	'''Context with a new variable of a type bound at index 0'''
 	assert isinstance(type, Type)
-	return ((Variable(0), type),) + tuple(
-		(increment(e), t)
-		for e, t in context
-	)
+	return Extension(context, type)
 
-@lru_cache(maxsize=None)
 def abstractions(context, steps):
+	'''Lazily yields the abstractions with the given number of steps'''
 	assert isinstance(steps, int) and steps >= 0
-	return tuple(
+	return (
 		(Abstraction(t, e), FunctionType(t, e_t))
 		for n in range(steps)
 		for t in types(n)
 		for e, e_t in terms(augment(context, t), steps - 1 - n)
 	)
 
-@lru_cache(maxsize=None)
+def signatures(level):
+	'''Groups the terms of a level by the argument type and by the result type of their function types'''
+	by_argument = {}
+	by_result = {}
+	for e, t in level:
+		if isinstance(t, FunctionType):
+			by_argument.setdefault(t.argument, []).append((e, t))
+			by_result.setdefault(t.result, []).append((e, t))
+	return (
+		{argument: tuple(group) for argument, group in by_argument.items()},
+		{result: tuple(group) for result, group in by_result.items()},
+	)
+
+@memoize(PINNED)
+def level_signatures(context, steps):
+	assert isinstance(steps, int) and steps >= 0
+	return signatures(terms(context, steps))
+
 def functions(context, steps, argument):
+	'''Terms with the given number of steps whose type is a function from the argument type'''
 	assert isinstance(steps, int) and steps >= 0
 	assert isinstance(argument, Type)
-	return tuple(
-		(e, t)
-		for e, t in terms(context, steps)
-		if isinstance(t, FunctionType) and t.argument == argument
-	)
+	return level_signatures(keyed(context), steps)[0].get(argument, ())
 
-@lru_cache(maxsize=None)
-def terms(context, steps):
+def producers(context, steps, result):
+	'''Terms with the given number of steps whose type is a function to the result type'''
 	assert isinstance(steps, int) and steps >= 0
+	assert isinstance(result, Type)
+	return level_signatures(keyed(context), steps)[1].get(result, ())
 
-	# Non-debug version
-	return context if steps == 0 else tuple(
-		(e, t)
-		for e, t in abstractions(context, steps) + applications(context, steps)
-		if (normalize(e), t) not in normal_forms(context, steps - 1)
-		if not any(inductively_equal(e, t, e2, t2) for e2, t2 in normal_forms_type(context, steps - 1, t))
-	)
+# Levels
+# An enumeration stores completed levels of terms, keyed by a key such as a
+# context (wrapped in Budgeted when enumerated under a normalization budget)
+# and steps. The terms of level 0 and the candidates of higher levels come
+# from the functions it is given, and each candidate is kept if its normal
+# form differs from those of the levels below. The plain, normal-form and
+# goal-directed enumerations only differ in these functions.
+
+class Enumeration:
+	'''Completed levels of terms, each deduplicated against the levels below it.
+	Candidates are (term, type) pairs, normalized within the budget of
+	reducers unless they are built in normal form already.'''
+	def __init__(self, initial, candidates, normalized=False, event=None, checkpointed=False):
+		self.initial = initial
+		self.candidates = candidates
+		self.normalized = normalized
+		self.event = event
+		self.checkpointed = checkpointed
+		self.levels = {}
+		# Candidates left out of their level because their normalization ran out of
+		# the fuel or time set in reducers, keyed like the levels
+		self.undecided = {}
+	def terms(self, key, steps):
+		assert isinstance(steps, int) and steps >= 0
+		if (key, steps) not in self.levels:
+			for _ in self.level(key, steps):
+				pass
+		return self.levels[key, steps]
+	def level(self, key, steps):
+		'''Lazily yields the new terms with the given number of steps, storing the level once it is complete.
+		If the level is completed elsewhere while the generator is paused, it
+		yields the rest of the stored level when resumed.'''
+		assert isinstance(steps, int) and steps >= 0
+		if (key, steps) in self.levels:
+			yield from self.levels[key, steps]
+			return
+		if steps == 0:
+			self.complete(key, steps, tuple(self.initial(key)))
+			yield from self.levels[key, steps]
+			return
+		start = time.perf_counter()
+		candidates = 0
+		found = []
+		left_out = []
+		normal_forms_index = self.index(key, steps - 1)
+		for e, t in self.candidates(key, steps):
+			candidates += 1
+			normal_form = e if self.normalized else try_normalize(e)
+			if isinstance(normal_form, OutOfFuel):
+				left_out.append((e, t))
+				continue
+			if novel(normal_forms_index, e, t, normal_form, steps):
+				found.append((e, t))
+				yield e, t
+				if (key, steps) in self.levels:
+					yield from self.levels[key, steps][len(found):]
+					return
+		if left_out:
+			self.undecided.setdefault((key, steps), left_out)
+		self.complete(key, steps, tuple(found))
+		if metrics.enabled and self.event is not None:
+			# Includes the time spent on sub-levels computed on demand
+			self.emit(key, steps, candidates, start)
+	def emit(self, key, steps, candidates, start):
+		'''Emits the metrics event of a completed level'''
+		metrics.emit(
+			self.event,
+			context=digest(key),
+			steps=steps,
+			candidates=candidates,
+			terms=len(self.levels[key, steps]),
+			undecided=len(self.undecided.get((key, steps), ())),
+			seconds=time.perf_counter() - start,
+		)
+	def complete(self, key, steps, level):
+		'''Stores a completed level, unless it is already stored, checkpointing it if it is enumerated
+		without a budget by a checkpointed enumeration while a checkpoint directory is set'''
+		if (key, steps) in self.levels:
+			return
+		self.levels[key, steps] = level
+		if self.checkpointed and checkpoints is not None and not isinstance(root(key), Budgeted):
+			save(checkpoints, key, steps)
+	def index(self, key, steps):
+		'''Index of the normal forms of the terms with at most the given number of steps'''
+		assert isinstance(steps, int) and steps >= 0
+		normal_forms_index = index(self, key)
+		while normal_forms_index.levels <= steps:
+			level = self.terms(key, normal_forms_index.levels)
+			normal_forms_index.add(level, tuple(e for e, t in level) if self.normalized else None)
+		return normal_forms_index
+	def stream(self, key):
+		'''Lazily yields every term in order of steps, so that callers can stop early'''
+		for steps in count():
+			yield from self.level(key, steps)
+
+def novel(normal_forms_index, term, type, normal_form, steps):
+	'''Returns whether a candidate differs from every term in the levels of an index below the given number of steps.
+	The index may already hold higher levels, such as when a paused level
+	is resumed after they were enumerated.'''
+	members = normal_forms_index.members
+	if members.get((normal_form, type), steps) < steps:
+		return False
+	# A normal form congruent to an earlier one through the lemmas proven so far needs no proof
+	egraph = normal_forms_index.egraph
+	representative = egraph.representative(normal_form)
+	if representative is not None and members.get((representative, type), steps) < steps:
+		return False
+	for e2, t2 in similar(normal_forms_index, normal_form, type):
+		if members[e2, t2] >= steps:
+			continue
+		if inductively_equal(term, type, e2, t2):
+			egraph.equate(normal_form, e2)
+			return False
+	return True
+
+def level_candidates(context, steps):
+	return chain(abstractions(context, steps), applications(context, steps))
+
+enumeration = Enumeration(tuple, level_candidates, event='level', checkpointed=True)
+
+# Completed levels and undecided candidates of the enumeration
+levels = enumeration.levels
+undecided = enumeration.undecided
+
+def terms(context, steps):
+	return enumeration.terms(keyed(context), steps)
+
+def level(context, steps):
+	'''Lazily yields the new terms with the given number of steps, see Enumeration.level'''
+	return enumeration.level(keyed(context), steps)
 	# Should also make sure that only 1 inductively-equivalent function makes it per round
 
 	'''
@@ -86,36 +291,345 @@ def terms(context, steps):
 		#return results
 	'''
 
-@lru_cache(maxsize=None)
+def stream(context):
+	return enumeration.stream(keyed(context))
+
 def normal_forms(context, steps):
+	return enumeration.index(keyed(context), steps)
+
+# Normal-form enumeration
+# Only terms in beta, eta and iter normal form are built: bodies, functions
+# and arguments come from normal levels, an application never has an
+# abstraction or iter applied to zero or a successor as its function, and
+# an abstraction is never an eta-redex. Every normal form is then built
+# exactly once, at the level of its own size, so candidates need neither
+# normalization nor a membership check, only the inductive one.
+
+def normal_abstractions(context, steps):
+	'''Lazily yields the abstractions in normal form with the given number of steps'''
 	assert isinstance(steps, int) and steps >= 0
-	return tuple(
-		(() if steps == 0 else normal_forms(context, steps - 1)) +
-		tuple((normalize(e), t) for e, t in terms(context, steps))
+	for n in range(steps):
+		for t in types(n):
+			for e, e_t in normal_terms(augment(context, t), steps - 1 - n):
+				abstraction = Abstraction(t, e)
+				if not is_eta_reducible(abstraction):
+					yield abstraction, FunctionType(t, e_t)
+
+@memoize(PINNED)
+def normal_signatures(context, steps):
+	assert isinstance(steps, int) and steps >= 0
+	return signatures(normal_terms(context, steps))
+
+def normal_applications(context, steps):
+	'''Lazily yields the applications in normal form with the given number of steps'''
+	assert isinstance(steps, int) and steps >= 0
+	for n in range(steps):
+		by_argument = normal_signatures(context, steps - 1 - n)[0]
+		if not by_argument:
+			continue
+		for e2, e2_t in normal_terms(context, n):
+			for e1, e1_t in by_argument.get(e2_t, ()):
+				if isinstance(e1, Abstraction):
+					continue
+				application = Application(e1, e2)
+				if not is_iter_reducible(application):
+					yield application, e1_t.result
+
+def normal_candidates(context, steps):
+	return chain(normal_abstractions(context, steps), normal_applications(context, steps))
+
+normal_enumeration = Enumeration(tuple, normal_candidates, normalized=True)
+
+# Completed normal levels
+normal_levels = normal_enumeration.levels
+
+def normal_terms(context, steps):
+	return normal_enumeration.terms(keyed(context), steps)
+
+def normal_level(context, steps):
+	return normal_enumeration.level(keyed(context), steps)
+
+def normal_terms_index(context, steps):
+	return normal_enumeration.index(keyed(context), steps)
+
+def normal_stream(context):
+	return normal_enumeration.stream(keyed(context))
+
+# Goal-directed enumeration
+# Only the terms of a target type are built, top-down: an abstraction is
+# built from inhabitants of its result type in the augmented context, and
+# an application pairs each argument from the memoized levels with the
+# inhabitants of the function type from the argument's type to the goal.
+# Each goal is deduplicated like terms, against the earlier terms of the
+# same type, so the inhabitants of a goal are exactly the terms of that type.
+# Its levels are keyed by the pair of the context and the goal.
+
+def goal_abstractions(context, goal, steps):
+	'''Lazily yields the abstractions of the goal type with the given number of steps'''
+	assert isinstance(steps, int) and steps >= 0
+	if isinstance(goal, FunctionType):
+		n = type_steps(goal.argument)
+		if n is not None and n < steps:
+			for e, t in goal_enumeration.terms((augment(context, goal.argument), goal.result), steps - 1 - n):
+				yield Abstraction(goal.argument, e)
+
+def goal_applications(context, goal, steps):
+	'''Lazily yields the applications of the goal type with the given number of steps'''
+	assert isinstance(steps, int) and steps >= 0
+	for n in range(steps):
+		for e2, e2_t in terms(context, n):
+			for e1, t in goal_enumeration.terms((context, FunctionType(e2_t, goal)), steps - 1 - n):
+				yield Application(e1, e2)
+
+def goal_initial(key):
+	context, goal = key
+	return tuple((e, t) for e, t in context if t == goal)
+
+def goal_candidates(key, steps):
+	context, goal = key
+	return (
+		(e, goal)
+		for e in chain(goal_abstractions(context, goal, steps), goal_applications(context, goal, steps))
 	)
 
-@lru_cache(maxsize=None)
-def normal_forms_type(context, steps, type):
-	return tuple(
-		(e, t)
-		for e, t in normal_forms(context, steps)
-		if t == type
+goal_enumeration = Enumeration(goal_initial, goal_candidates)
+
+# Completed levels of each goal
+goal_levels = goal_enumeration.levels
+
+def inhabitants(context, goal, steps):
+	'''Terms of the goal type with the given number of steps'''
+	assert isinstance(goal, Type)
+	return tuple(e for e, t in goal_enumeration.terms((keyed(context), goal), steps))
+
+def goal_level(context, goal, steps):
+	'''Lazily yields the new terms of the goal type with the given number of steps'''
+	assert isinstance(goal, Type)
+	return (e for e, t in goal_enumeration.level((keyed(context), goal), steps))
+
+def goal_normal_forms(context, goal, steps):
+	return goal_enumeration.index((keyed(context), goal), steps)
+
+def search(context, goal):
+	'''Lazily yields every term of the goal type in order of steps'''
+	assert isinstance(goal, Type)
+	return (e for e, t in goal_enumeration.stream((keyed(context), goal)))
+
+# Parallel enumeration
+# The abstraction partitions (n, t) and application partitions n of a level
+# are built and normalized in worker processes, merged in the same order as
+# the serial enumeration, and then deduplicated in the parent process. Each
+# worker starts from the completed levels of its parent, with their normal
+# forms, and from its normalization budget, so that it does not depend on
+# inheriting them through fork.
+
+def prepare(snapshot, fuel, deadline):
+	'''Initializes a worker process with the levels and normalization budget of its parent'''
+	reducers.fuel = fuel
+	reducers.deadline = deadline
+	load(snapshot)
+
+def snapshot():
+	'''Every completed level with its normal forms, in the format of the checkpoints'''
+	return [
+		(context, steps, level, tuple(normalize(e) for e, t in level))
+		for (context, steps), level in levels.items()
+	]
+
+def abstraction_partition(context, steps, n, t):
+	'''Abstractions with the given binder type, their normal forms, and the levels computed for them'''
+	known = set(levels)
+	partition = [
+		(Abstraction(t, e), FunctionType(t, e_t))
+		for e, e_t in terms(augment(context, t), steps - 1 - n)
+	]
+	computed = {key: value for key, value in levels.items() if key not in known}
+	return [(e, t, try_normalize(e)) for e, t in partition], computed
+
+def application_partition(context, steps, n):
+	'''Applications whose argument has n steps, with their normal forms'''
+	by_argument = level_signatures(context, steps - 1 - n)[0]
+	return [
+		(Application(e1, e2), e1_t.result, try_normalize(Application(e1, e2)))
+		for e2, e2_t in terms(context, n)
+		if e2_t in by_argument
+		for e1, e1_t in by_argument[e2_t]
+	]
+
+def parallel_terms(context, steps, workers=None):
+	'''Same as terms, building and normalizing the candidates of each level in a process pool'''
+	assert isinstance(steps, int) and steps >= 0
+	context = keyed(context)
+	if (context, steps) in levels or steps == 0:
+		return terms(context, steps)
+	for n in range(steps):
+		parallel_terms(context, n, workers)
+	start = time.perf_counter()
+	with ProcessPoolExecutor(workers, initializer=prepare, initargs=(snapshot(), reducers.fuel, reducers.deadline)) as executor:
+		abstraction_futures = [
+			executor.submit(abstraction_partition, context, steps, n, t)
+			for n in range(steps)
+			for t in types(n)
+		]
+		application_futures = [
+			executor.submit(application_partition, context, steps, n)
+			for n in range(steps)
+		]
+		candidates = []
+		for future in abstraction_futures:
+			partition, computed = future.result()
+			for (sub_context, sub_steps), value in computed.items():
+				enumeration.complete(sub_context, sub_steps, value)
+			candidates += partition
+		for future in application_futures:
+			candidates += future.result()
+	normal_forms_index = normal_forms(context, steps - 1)
+	found = []
+	left_out = []
+	for e, t, normal_form in candidates:
+		if isinstance(normal_form, OutOfFuel):
+			left_out.append((e, t))
+		elif novel(normal_forms_index, e, t, normal_form, steps):
+			found.append((e, t))
+	if left_out:
+		undecided.setdefault((context, steps), left_out)
+	enumeration.complete(context, steps, tuple(found))
+	if metrics.enabled:
+		enumeration.emit(context, steps, len(candidates), start)
+	return levels[context, steps]
+
+class Index:
+	'''Normal forms of the levels enumerated so far in a context, extended one level at a time.
+	Members map each normal form and type to the level it was added with.'''
+	def __init__(self):
+		self.levels = 0
+		self.members = {}
+		self.types = {}
+		self.fingerprints = {}
+		self.egraph = EGraph()
+	def add(self, level, normal_forms=None):
+		if normal_forms is None:
+			normal_forms = tuple(normalize(e) for e, t in level)
+		for e, (_, t) in zip(normal_forms, level):
+			self.members.setdefault((e, t), self.levels)
+			self.egraph.represent(e)
+			self.types.setdefault(t, []).append((e, t))
+			self.fingerprints.setdefault((t, fingerprint(e, t)), []).append((e, t))
+		self.levels += 1
+
+@memoize(PINNED)
+def index(enumeration, key):
+	return Index()
+
+# Checkpoints
+# Each completed level is pickled to its own file together with its normal
+# forms, so that an interrupted enumeration can be resumed without
+# recomputing or renormalizing the levels it already completed.
+
+# Directory in which completed levels are checkpointed, if any
+checkpoints = None
+
+def digest(context):
+	'''Short identifier of a context that is stable across processes'''
+	return hashlib.sha256(str(context).encode()).hexdigest()[:16]
+
+def checkpoint_path(directory, context, steps):
+	return os.path.join(directory, '{}-{}.pickle'.format(digest(context), steps))
+
+def save(directory, context, steps):
+	'''Writes a completed level and its normal forms to a checkpoint file'''
+	level = levels[context, steps]
+	normal_forms = tuple(normalize(e) for e, t in level)
+	path = checkpoint_path(directory, context, steps)
+	with open(path + '.tmp', 'wb') as file:
+		pickle.dump((context, steps, level, normal_forms), file, pickle.HIGHEST_PROTOCOL)
+	os.replace(path + '.tmp', path)
+
+def resume(directory):
+	'''Loads the levels checkpointed in a directory and checkpoints new levels there'''
+	global checkpoints
+	os.makedirs(directory, exist_ok=True)
+	checkpoints = directory
+	loaded = []
+	for name in os.listdir(directory):
+		if name.endswith('.pickle'):
+			with open(os.path.join(directory, name), 'rb') as file:
+				loaded.append(pickle.load(file))
+	load(loaded)
+	return len(loaded)
+
+def load(loaded):
+	'''Installs levels given with their normal forms as (context, steps, level, normal forms), in order of steps'''
+	for context, steps, level, normal_forms in sorted(loaded, key=lambda checkpoint: checkpoint[1]):
+		levels.setdefault((context, steps), level)
+		if index(enumeration, context).levels == steps:
+			index(enumeration, context).add(level, normal_forms)
+
+# Fingerprints
+# Closed terms of type (ℕ → … → ℕ) are hashed by their outputs on a fixed
+# set of probe inputs. Observationally equal terms share a fingerprint, so
+# inductive equality only needs to be checked within a bucket.
+
+probes = range(3)
+
+@memoize(DERIVED)
+def fingerprint(term, type):
+	'''Outputs of a term on every combination of probes, or None if it cannot be evaluated'''
+	arity = 0
+	while isinstance(type, FunctionType):
+		if type.argument != natural:
+			return None
+		arity += 1
+		type = type.result
+	try:
+		function = compile_term(term)
+	except Exception:
+		return None
+	outputs = []
+	for inputs in product(probes, repeat=arity):
+		value = function
+		for x in inputs:
+			value = value(x)
+		outputs.append(value)
+	return tuple(outputs)
+
+def similar(normal_forms_index, normal_form, type):
+	'''Normal forms in an index that may be equal to a normal form, according to their fingerprints'''
+	key = fingerprint(normal_form, type)
+	if key is None:
+		return normal_forms_index.types.get(type, [])
+	return (
+		normal_forms_index.fingerprints.get((type, key), []) +
+		normal_forms_index.fingerprints.get((type, None), [])
 	)
 
-@lru_cache(maxsize=None)
 def applications(context, steps):
+	'''Lazily yields the applications with the given number of steps'''
 	assert isinstance(steps, int) and steps >= 0
-	return tuple(
-		(Application(e1, e2), e1_t.result)
-		for n in range(steps)
-		for e2, e2_t in terms(context, n)
-		for e1, e1_t in functions(context, steps - 1 - n, e2_t)
-	)
+	for n in range(steps):
+		# Only the arguments whose type has functions at the complementary step count are paired
+		by_argument = level_signatures(context, steps - 1 - n)[0]
+		if not by_argument:
+			continue
+		for e2, e2_t in terms(context, n):
+			for e1, e1_t in by_argument.get(e2_t, ()):
+				yield Application(e1, e2), e1_t.result
 
 natural = BaseType('\u2115')
 penalty = 1
 
-@lru_cache(maxsize=None)
+def type_steps(type):
+	'''Number of steps types takes to build a type, or None if it never builds it'''
+	if isinstance(type, FunctionType):
+		argument = type_steps(type.argument)
+		result = type_steps(type.result)
+		if argument is not None and result is not None:
+			return penalty + argument + result
+	elif type == natural:
+		return 0
+	return None
+
+@memoize(PINNED)
 def types(steps):
 	assert isinstance(steps, int) and steps >= 0
 	return (natural,) if steps == 0 else tuple(
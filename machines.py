@@ -0,0 +1,101 @@
+from entities import *
+from caches import memoize, DERIVED
+from reducers import natural
+from evaluators import Closure, Neutral, iter_zero, iter_succ, lookup, read_back
+
+# Krivine machine with sharing
+# Arguments are pushed as thunks that pair a term with its environment,
+# so substitution never copies or re-indexes a term. Environments are
+# linked lists shared between thunks, a thunk is evaluated at most once,
+# and variables are converted from levels to indices only on read-back.
+# Here closure environments and neutral spines hold thunks, not values.
+
+class Thunk:
+	'''Delayed term together with the environment it is to be evaluated in'''
+	__slots__ = ('term', 'environment', 'value')
+	def __init__(self, term, environment, value=None):
+		self.term = term
+		self.environment = environment
+		self.value = value
+
+def force(thunk):
+	'''Weak head normal form of a thunk, computed once and shared'''
+	if thunk.value is None:
+		thunk.value = run(thunk.term, thunk.environment)
+	return thunk.value
+
+def iterate(counter):
+	'''Term and environment that iter unfolds to on a counter value, or None if it is stuck'''
+	if isinstance(counter, Neutral):
+		if counter.head == Constant('zero') and not counter.arguments:
+			return Abstraction(FunctionType(natural, natural), iter_zero), None
+		elif counter.head == Constant('succ') and len(counter.arguments) == 1:
+			return Abstraction(FunctionType(natural, natural), iter_succ), (counter.arguments[0], None)
+	return None
+
+def run(term, environment):
+	'''Runs the machine to weak head normal form'''
+	# A thunk that is needed but not yet evaluated suspends the machine on an
+	# explicit stack instead of forcing it recursively. The machine resumes at
+	# the same term once the thunk has its value.
+	stack = []
+	suspended = []
+	while True:
+		if isinstance(term, Application):
+			stack.append(Thunk(term.argument, environment))
+			term = term.function
+			continue
+		elif isinstance(term, Abstraction):
+			if stack:
+				environment = (stack.pop(), environment)
+				term = term.body
+				continue
+			value = Closure(term.type, term.body, environment)
+		else:
+			if isinstance(term, Variable):
+				thunk = lookup(environment, term.index)
+				if thunk.value is None:
+					suspended.append((thunk, term, environment, stack))
+					term, environment, stack = thunk.term, thunk.environment, []
+					continue
+				value = thunk.value
+			else:
+				value = Neutral(term)
+			if isinstance(value, Closure):
+				if stack:
+					environment = (stack.pop(), value.environment)
+					term = value.body
+					continue
+			else:
+				# iter is unfolded whether it is reached directly or through a variable
+				if stack and value.head == Constant('iter') and not value.arguments:
+					counter = stack[-1]
+					if counter.value is None:
+						suspended.append((counter, term, environment, stack))
+						term, environment, stack = counter.term, counter.environment, []
+						continue
+					unfolded = iterate(counter.value)
+					if unfolded is not None:
+						stack.pop()
+						term, environment = unfolded
+						continue
+				if stack:
+					value = Neutral(value.head, value.arguments + tuple(reversed(stack)))
+		if not suspended:
+			return value
+		thunk, term, environment, stack = suspended.pop()
+		thunk.value = value
+
+def instantiate(closure, depth):
+	'''Weak head normal form of the body of a closure with its variable bound to the de Bruijn level depth'''
+	return run(closure.body, (Thunk(None, None, Neutral(depth)), closure.environment))
+
+@memoize(DERIVED)
+def normalize_by_machine(term):
+	'''Normal form of a term, computed by the machine and read-back'''
+	assert isinstance(term, Term)
+	depth = term.bound
+	environment = None
+	for level in range(depth):
+		environment = (Thunk(None, None, Neutral(level)), environment)
+	return read_back(run(term, environment), depth, instantiate, force)
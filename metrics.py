@@ -0,0 +1,43 @@
+import json
+import sys
+import time
+from collections import Counter
+from caches import manager
+
+# Instrumentation
+# Disabled by default. Hot paths check `metrics.enabled` before recording
+# anything, so the cost when disabled is a single attribute lookup.
+# Events are written as JSON lines.
+
+enabled = False
+output = sys.stderr
+counters = Counter()
+
+def enable(file=sys.stderr):
+	'''Starts recording, writing events to a file'''
+	global enabled, output
+	enabled = True
+	output = file
+
+def disable():
+	global enabled
+	enabled = False
+
+def count(name, amount=1):
+	counters[name] += amount
+
+def emit(event, **fields):
+	'''Writes an event as a JSON line'''
+	record = {'event': event, 'time': time.time()}
+	record.update(fields)
+	output.write(json.dumps(record, default=str) + '\n')
+	output.flush()
+
+def report():
+	'''Writes the counters and the hits, misses and size of every memo table'''
+	emit('counters', **counters)
+	for info in manager.info():
+		emit('cache', **info)
+
+def reset():
+	counters.clear()
@@ -1,43 +1,76 @@
+import time
 from entities import *
-from functools import lru_cache
+from caches import memoize, TRANSIENT, DERIVED
+import metrics
 
-@lru_cache(maxsize=None)
+# Traversals use explicit stacks rather than recursion, so that the depth
+# of a term is limited by memory rather than by the recursion limit.
+# Frames are (term, depth, visited): a node is visited once on the way down
+# and once more on the way up to rebuild it from the results of its children.
+
+@memoize(TRANSIENT)
 def lift(term, offset, depth=0):
 	'''Increment indices of variables that are free at given depth'''
 	assert isinstance(term, Term)
 	assert isinstance(offset, int)
-	if isinstance(term, Constant):
-		return term
-	if isinstance(term, Variable):
-		if term.index < depth:
-			# Bound variable
-			return term
-		else:
+	stack = [(term, depth, False)]
+	results = []
+	while stack:
+		term, depth, visited = stack.pop()
+		if term.bound <= depth:
+			# No free variables, so the subterm is shared unchanged
+			results.append(term)
+		elif isinstance(term, Variable):
 			# Free variable
-			return Variable(term.index + offset)
-	elif isinstance(term, Abstraction):
-		return Abstraction(term.type, lift(term.body, offset, depth + 1))
-	elif isinstance(term, Application):
-		return Application(lift(term.function, offset, depth), lift(term.argument, offset, depth))
+			results.append(Variable(term.index + offset))
+		elif isinstance(term, Abstraction):
+			if visited:
+				results.append(Abstraction(term.type, results.pop()))
+			else:
+				stack.append((term, depth, True))
+				stack.append((term.body, depth + 1, False))
+		elif isinstance(term, Application):
+			if visited:
+				argument = results.pop()
+				results.append(Application(results.pop(), argument))
+			else:
+				stack.append((term, depth, True))
+				stack.append((term.argument, depth, False))
+				stack.append((term.function, depth, False))
+	return results.pop()
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def substitution(term, substitute, index=0):
 	'''Substitute the variable with the specified index'''
 	assert isinstance(term, Term)
 	assert isinstance(substitute, Term)
-	if isinstance(term, Constant):
-		return term
-	elif isinstance(term, Variable):
-		if term.index < index:
-			return term
-		elif term.index == index:
-			return lift(substitute, index)
-		else:
-			return Variable(term.index - 1)
-	elif isinstance(term, Abstraction):
-		return Abstraction(term.type, substitution(term.body, substitute, index + 1))
-	elif isinstance(term, Application):
-		return Application(substitution(term.function, substitute, index), substitution(term.argument, substitute, index))
+	stack = [(term, index, False)]
+	results = []
+	while stack:
+		term, index, visited = stack.pop()
+		if term.bound <= index:
+			# The substituted variable does not occur, and no index needs lowering
+			results.append(term)
+		elif isinstance(term, Variable):
+			if term.index == index:
+				results.append(lift(substitute, index))
+			else:
+				results.append(Variable(term.index - 1))
+		elif isinstance(term, Abstraction):
+			if visited:
+				results.append(Abstraction(term.type, results.pop()))
+			else:
+				stack.append((term, index, True))
+				stack.append((term.body, index + 1, False))
+		elif isinstance(term, Application):
+			if visited:
+				argument = results.pop()
+				results.append(Application(results.pop(), argument))
+			else:
+				stack.append((term, index, True))
+				stack.append((term.argument, index, False))
+				stack.append((term.function, index, False))
+	return results.pop()
 
 
 
@@ -45,12 +78,12 @@ def substitution(term, substitute, index=0):
 
 # Beta reduction
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def is_beta_reducible(term):
 	assert isinstance(term, Term)
 	return isinstance(term, Application) and isinstance(term.function, Abstraction)
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def beta_reduce(term):
 	assert isinstance(term, Term)
 	return substitution(term.function.body, term.argument)
@@ -61,26 +94,32 @@ def beta_reduce(term):
 # Eta reduction
 # Example: (λ:ℕ (succ 0)) → succ
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def occurs(variable, term):
 	'''Returns whether a variable occurs in a term'''
 	assert isinstance(variable, Variable)
 	assert isinstance(term, Term)
-	if isinstance(term, Constant):
-		return False
-	elif isinstance(term, Variable):
-		return term.index == variable.index
-	elif isinstance(term, Abstraction):
-		return occurs(Variable(variable.index + 1), term.body)
-	elif isinstance(term, Application):
-		return occurs(variable, term.function) or occurs(variable, term.argument)
+	stack = [(term, variable.index)]
+	while stack:
+		term, index = stack.pop()
+		if term.bound <= index:
+			continue
+		elif isinstance(term, Variable):
+			if term.index == index:
+				return True
+		elif isinstance(term, Abstraction):
+			stack.append((term.body, index + 1))
+		elif isinstance(term, Application):
+			stack.append((term.argument, index))
+			stack.append((term.function, index))
+	return False
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def is_eta_reducible(term):
 	assert isinstance(term, Term)
 	return isinstance(term, Abstraction) and isinstance(term.body, Application) and term.body.argument == Variable(0) and not occurs(Variable(0), term.body.function)
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def eta_reduce(term):
 	assert isinstance(term, Term)
 	return lift(term.body.function, -1)
@@ -94,7 +133,7 @@ def eta_reduce(term):
 
 natural = BaseType('\u2115')
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def is_iter_reducible(term):
 	assert isinstance(term, Term)
 
@@ -121,7 +160,7 @@ def is_iter_reducible(term):
 		)
 	)
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def iter_reduce(term):
 	# New version
 	if isinstance(term, Application) and term.function == Constant('iter'):
@@ -188,12 +227,12 @@ def iter_reduce(term):
 
 
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def is_head_reducible(term):
 	'''Returns whether a term is a redex'''
 	return is_beta_reducible(term) or is_eta_reducible(term) or is_iter_reducible(term)
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def head_reduce(term):
 	if is_beta_reducible(term):
 		return beta_reduce(term)
@@ -202,14 +241,14 @@ def head_reduce(term):
 	elif is_iter_reducible(term):
 		return iter_reduce(term)
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def head_normalize(term):
 	'''Head normal form of a term'''
 	while is_head_reducible(term):
 		term = head_reduce(term)
 	return term
 
-@lru_cache(maxsize=None)
+@memoize(DERIVED)
 def normalize(term):
 	'''Normal form of a term'''
 	if isinstance(term, Constant):
@@ -244,47 +283,37 @@ def normalize(term):
 
 
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def unchurch(term):
 	assert isinstance(term, Term)
+	number = 0
+	while isinstance(term, Application) and term.function == Constant('succ'):
+		number += 1
+		term = term.argument
 	if term == Constant('zero'):
-		return 0
-	elif isinstance(term, Application) and term.function == Constant('succ'):
-		return 1 + unchurch(term.argument)
+		return number
 	else:
 		raise Exception('Not in church form: {}'.format(term))
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def church(number):
 	assert isinstance(number, int)
-	if number == 0:
-		return Constant('zero')
-	else:
-		return Application(Constant('succ'), church(number - 1))
+	term = Constant('zero')
+	for _ in range(number):
+		term = Application(Constant('succ'), term)
+	return term
 
 
 
 
-@lru_cache(maxsize=None)
 def type_size(type):
 	assert isinstance(type, Type)
+	return type.size
 
-	if isinstance(type, BaseType):
-		return 0
-	elif isinstance(type, FunctionType):
-		return 1 + type_size(type.argument) + type_size(type.result)
 
-
-@lru_cache(maxsize=None)
 def size(term):
 	assert isinstance(term, Term)
-
-	if isinstance(term, Variable) or isinstance(term, Constant):
-		return 0
-	elif isinstance(term, Abstraction):
-		return 1 + type_size(term.type) + size(term.body)
-	elif isinstance(term, Application):
-		return 1 + size(term.function) + size(term.argument)
+	return term.size
 
 
 
@@ -296,26 +325,32 @@ def size(term):
 
 
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def occurs(variable, term):
 	'''Returns whether a variable occurs in a term'''
 	assert isinstance(variable, Variable)
 	assert isinstance(term, Term)
-	if isinstance(term, Constant):
-		return False
-	elif isinstance(term, Variable):
-		return term.index == variable.index
-	elif isinstance(term, Abstraction):
-		return occurs(Variable(variable.index + 1), term.body)
-	elif isinstance(term, Application):
-		return occurs(variable, term.function) or occurs(variable, term.argument)
+	stack = [(term, variable.index)]
+	while stack:
+		term, index = stack.pop()
+		if term.bound <= index:
+			continue
+		elif isinstance(term, Variable):
+			if term.index == index:
+				return True
+		elif isinstance(term, Abstraction):
+			stack.append((term.body, index + 1))
+		elif isinstance(term, Application):
+			stack.append((term.argument, index))
+			stack.append((term.function, index))
+	return False
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def is_eta_reducible(term):
 	assert isinstance(term, Term)
 	return isinstance(term, Abstraction) and isinstance(term.body, Application) and term.body.argument == Variable(0) and not occurs(Variable(0), term.body.function)
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def eta_reduce(term):
 	assert isinstance(term, Term)
 	return lift(term.body.function, -1)
@@ -325,25 +360,37 @@ def eta_reduce(term):
 
 
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def replace(term, occurrence, substitute):
-	if term == occurrence:
-		return substitute
-	elif isinstance(term, Abstraction):
-		return Abstraction(term.type, replace(term.body, occurrence, substitute))
-	elif isinstance(term, Application):
-		return Application(
-			replace(term.function, occurrence, substitute),
-			replace(term.argument, occurrence, substitute)
-		)
-	else:
-		return term
+	stack = [(term, False)]
+	results = []
+	while stack:
+		term, visited = stack.pop()
+		if term == occurrence:
+			results.append(substitute)
+		elif isinstance(term, Abstraction):
+			if visited:
+				results.append(Abstraction(term.type, results.pop()))
+			else:
+				stack.append((term, True))
+				stack.append((term.body, False))
+		elif isinstance(term, Application):
+			if visited:
+				argument = results.pop()
+				results.append(Application(results.pop(), argument))
+			else:
+				stack.append((term, True))
+				stack.append((term.argument, False))
+				stack.append((term.function, False))
+		else:
+			results.append(term)
+	return results.pop()
 
 
 
 from random import randint
 
-@lru_cache(maxsize=None)
+@memoize(DERIVED)
 def inductively_equal_old(f, f_t, g, g_t):
 
 	if f == g:
@@ -398,12 +445,24 @@ def inductively_equal_old(f, f_t, g, g_t):
 natural = BaseType('ℕ')
 
 def inductively_equal(f, f_t, g, g_t, log=False):
-	return (
-		inductively_equal_helper(f, f_t, g, g_t, log) or
-		inductively_equal_helper(g, f_t, f, g_t, log)
-	)
-
-@lru_cache(maxsize=None)
+	if log:
+		# Traced proof, running the induction in both directions
+		equal = (
+			inductively_equal_helper(f, f_t, g, g_t, log) or
+			inductively_equal_helper(g, f_t, f, g_t, log)
+		)
+	else:
+		try:
+			equal = provably_equal(f, f_t, g, g_t)
+		except Undecided:
+			# Unknown, which callers treat like an equality that was not proven
+			equal = None
+	if metrics.enabled:
+		metrics.count('inductively_equal')
+		metrics.count({True: 'inductively_equal.equal', False: 'inductively_equal.unequal', None: 'inductively_equal.unknown'}[equal])
+	return equal
+
+@memoize(DERIVED)
 def inductively_equal_helper(f, f_t, g, g_t, log=False):
 	if log:
 		print('\nf = {}'.format(f))
@@ -418,7 +477,7 @@ def inductively_equal_helper(f, f_t, g, g_t, log=False):
 			f_0 = normalize(Application(f, Constant('zero')))
 			g_0 = normalize(Application(g, Constant('zero')))
 
-			n = Constant('${}'.format(randint(0, 1000))) # Greater range = lower false positive rate?
+			n = fresh(f, g)
 			succ_n = Application(Constant('succ'), n)
 
 			f_n = normalize(Application(f, n))
@@ -453,29 +512,119 @@ def inductively_equal_helper(f, f_t, g, g_t, log=False):
 	else:
 		return False
 
+# Deterministic induction
+# The induction variable is a constant $k named after the greatest one in
+# the compared terms, so that it cannot collide with them and the outcome of
+# a proof does not depend on the order of calls. The cases f(0), f(n) and
+# f(succ n) of a term are normalized once, and both directions of the
+# inductive step share them. Proven equalities are merged in a union-find
+# over typed normal forms, so that any two members of a merged class are
+# known equal without another proof.
+
+def fresh(*terms):
+	'''Induction variable that does not occur in the terms'''
+	k = 0
+	stack = list(terms)
+	while stack:
+		term = stack.pop()
+		if isinstance(term, Application):
+			stack.append(term.function)
+			stack.append(term.argument)
+		elif isinstance(term, Abstraction):
+			stack.append(term.body)
+		elif isinstance(term, Constant) and term.name.startswith('$'):
+			k = max(k, int(term.name[1:]) + 1)
+	return Constant('${}'.format(k))
+
+@memoize(DERIVED)
+def cases(f, n):
+	'''Normal forms of f(0), f(n) and f(succ n)'''
+	return (
+		decided_normalize(Application(f, Constant('zero'))),
+		decided_normalize(Application(f, n)),
+		decided_normalize(Application(f, Application(Constant('succ'), n))),
+	)
 
+class Equivalences:
+	'''Union-find over pairs of a normal form and its type'''
+	def __init__(self):
+		self.parents = {}
+	def find(self, key):
+		parents = self.parents
+		root = key
+		while root in parents:
+			root = parents[root]
+		while key in parents and parents[key] != root:
+			parents[key], key = root, parents[key]
+		return root
+	def union(self, a, b):
+		a = self.find(a)
+		b = self.find(b)
+		if a != b:
+			self.parents[a] = b
+	def equivalent(self, a, b):
+		return self.find(a) == self.find(b)
+	def clear(self):
+		self.parents.clear()
+
+equivalences = Equivalences()
+
+@memoize(DERIVED)
+def induction(f, g, type):
+	'''Whether two normal forms of a type are equal by induction on their first argument'''
+	if not (isinstance(type, FunctionType) and type.argument == natural):
+		return False
+	n = fresh(f, g)
+	f_0, f_n, f_succ_n = cases(f, n)
+	g_0, g_n, g_succ_n = cases(g, n)
+	if not provably_equal(f_0, type.result, g_0, type.result):
+		return False
+	return (
+		provably_equal(replace(f_succ_n, f_n, g_n), type.result, g_succ_n, type.result) or
+		provably_equal(replace(g_succ_n, g_n, f_n), type.result, f_succ_n, type.result)
+	)
 
+def provably_equal(f, f_t, g, g_t):
+	'''Deterministic inductive equality, merging the classes of the terms when it holds.
+	Like the traced helper, it only decides equality at ℕ and at functions
+	from ℕ, and is false at every other type.'''
+	if f_t != g_t:
+		return False
+	if not (f_t == natural or (isinstance(f_t, FunctionType) and f_t.argument == natural)):
+		return False
+	f = decided_normalize(f)
+	g = decided_normalize(g)
+	if f == g or equivalences.equivalent((f, f_t), (g, g_t)):
+		return True
+	if induction(f, g, f_t):
+		equivalences.union((f, f_t), (g, g_t))
+		return True
+	return False
 
-
-
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def eta_reduce(term):
 	if isinstance(term, Abstraction) and isinstance(term.body, Application) and term.body.argument == Variable(0) and not occurs(Variable(0), term.body.function):
+		if metrics.enabled:
+			metrics.count('eta')
 		return lift(term.body.function, -1)
 	else:
 		return False
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def beta_reduce(term):
 	if isinstance(term, Application) and isinstance(term.function, Abstraction):
+		if metrics.enabled:
+			metrics.count('beta')
 		return substitution(term.function.body, term.argument)
 	else:
 		return False
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def iter_reduce(term):
 	if isinstance(term, Application) and term.function == Constant('iter'):
 		if term.argument == Constant('zero'):
+			if metrics.enabled:
+				metrics.count('iter')
 			return Abstraction(
 				FunctionType(natural, natural),
 				Abstraction(
@@ -484,6 +633,8 @@ def iter_reduce(term):
 				)
 			)
 		elif isinstance(term.argument, Application) and term.argument.function == Constant('succ'):
+			if metrics.enabled:
+				metrics.count('iter')
 			i = term.argument.argument
 			return Abstraction(
 				FunctionType(natural, natural),
@@ -509,33 +660,55 @@ def iter_reduce(term):
 	else:
 		return False
 
-@lru_cache(maxsize=None)
+@memoize(TRANSIENT)
 def reduce(term):
 	'''Returns False if not reducible'''
-	reduction = eta_reduce(term) or beta_reduce(term) or iter_reduce(term)
-	if reduction is not False:
-		return reduction
-
-	if isinstance(term, Abstraction):
-		body_reduction = reduce(term.body)
-		if body_reduction is False:
-			return False
-		else:
-			return Abstraction(term.type, body_reduction)
-	elif isinstance(term, Application):
-		function_reduction = reduce(term.function)
-		if function_reduction is False:
-			argument_reduction = reduce(term.argument)
-			if argument_reduction is False:
-				return False
+	# Search for the leftmost outermost redex, remembering the path to it as a
+	# linked list of (parent, whether it is the function, path) to rebuild the
+	# spine. Subterms found to be irreducible are recorded in the memo table,
+	# and variables and constants, which never reduce, are not visited.
+	if not term.nodes:
+		return False
+	table = reduce.cache
+	known = table.entries.get
+	stack = [(term, None, False)]
+	push = stack.append
+	pop = stack.pop
+	while stack:
+		term, path, visited = pop()
+		if visited:
+			table.put((term,), False)
+			continue
+		reduction = known((term,)) if path is not None else None
+		if reduction is False:
+			continue
+		if reduction is None:
+			if isinstance(term, Abstraction):
+				reduction = eta_reduce(term)
 			else:
-				return Application(term.function, argument_reduction)
+				reduction = beta_reduce(term) or iter_reduce(term)
+		if reduction is not False:
+			while path is not None:
+				parent, function, path = path
+				if isinstance(parent, Abstraction):
+					reduction = Abstraction(parent.type, reduction)
+				elif function:
+					reduction = Application(reduction, parent.argument)
+				else:
+					reduction = Application(parent.function, reduction)
+			return reduction
+		push((term, path, True))
+		if isinstance(term, Abstraction):
+			if term.body.nodes:
+				push((term.body, (term, False, path), False))
 		else:
-			return Application(function_reduction, term.argument)
-	else:
-		return False
+			if term.argument.nodes:
+				push((term.argument, (term, False, path), False))
+			if term.function.nodes:
+				push((term.function, (term, True, path), False))
+	return False
 
-@lru_cache(maxsize=None)
+@memoize(DERIVED)
 def normalize(term):
 	while True:
 		reduction = reduce(term)
@@ -545,10 +718,60 @@ def normalize(term):
 		else:
 			return term
 
-
-
-
-
-
-
-
+# Bounded normalization
+# Normalization can be given a budget of rewrites (fuel) and a wall-clock
+# deadline, as a value of time.perf_counter. Once either is spent it stops
+# with an OutOfFuel result carrying the term reached so far. The provers and
+# the enumerators use the module-wide budget below, under which each
+# normalization gets its own fuel and all of them share the deadline; an
+# equality that cannot be decided within it is unknown instead of blocking.
+
+fuel = None
+deadline = None
+
+class OutOfFuel:
+	'''Result of a normalization that was stopped, with the term it had reached'''
+	__slots__ = ('term',)
+	def __init__(self, term):
+		self.term = term
+	def __str__(self):
+		return 'out of fuel at {}'.format(self.term)
+	def __repr__(self):
+		return str(self)
+
+class Undecided(Exception):
+	'''Raised by the provers when a normalization runs out of fuel'''
+	pass
+
+def bounded_normalize(term, fuel=None, deadline=None):
+	'''Normal form of a term, or OutOfFuel once the given number of rewrites is spent or the deadline has passed'''
+	assert isinstance(term, Term)
+	normal_form = normalize.cache.get((term,))
+	if normal_form is not None:
+		return normal_form
+	start = term
+	rewrites = 0
+	while True:
+		reduction = reduce(term)
+		if reduction is False:
+			normalize.cache.put((start,), term)
+			return term
+		if (fuel is not None and rewrites >= fuel) or (deadline is not None and time.perf_counter() > deadline):
+			if metrics.enabled:
+				metrics.count('out_of_fuel')
+			return OutOfFuel(term)
+		term = reduction
+		rewrites += 1
+
+def try_normalize(term):
+	'''Normal form of a term within the module-wide budget, or OutOfFuel'''
+	if fuel is None and deadline is None:
+		return normalize(term)
+	return bounded_normalize(term, fuel, deadline)
+
+def decided_normalize(term):
+	'''Normal form of a term within the module-wide budget, raising Undecided beyond it'''
+	normal_form = try_normalize(term)
+	if isinstance(normal_form, OutOfFuel):
+		raise Undecided(normal_form)
+	return normal_form
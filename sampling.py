@@ -0,0 +1,82 @@
+import random
+from bisect import bisect_right
+from itertools import accumulate
+from entities import *
+from caches import memoize, DERIVED
+from generators import augment, type_steps
+from counting import signature, extend, raw_counts
+
+# Sampling
+# Terms with a given number of steps are drawn uniformly at random among
+# every term the grammar of generators builds, before deduplication, by
+# walking the counts of counting from the top down: each choice of a
+# construction is made with probability proportional to the number of terms
+# it leads to. Only the count tables are kept, so memory does not grow with
+# the number of samples.
+
+def choose(options, generator):
+	'''Picks one of a sequence of (weight, option) pairs with probability proportional to its weight'''
+	options = list(options)
+	remaining = generator.randrange(sum(weight for weight, option in options))
+	for weight, option in options:
+		if remaining < weight:
+			return option
+		remaining -= weight
+
+@memoize(DERIVED)
+def raw_functions(key, steps):
+	'''Numbers of terms of the function types with the given number of steps, grouped by result type'''
+	by_result = {}
+	for t, count in raw_counts(key, steps).items():
+		if isinstance(t, FunctionType):
+			by_result.setdefault(t.result, []).append((t.argument, count))
+	return by_result
+
+def draw(context, key, steps, type, generator):
+	'''Uniformly random term of a type with the given number of steps in a context with a signature'''
+	if steps == 0:
+		return choose(((1, e) for e, t in context if t == type), generator)
+	options = []
+	if isinstance(type, FunctionType):
+		n = type_steps(type.argument)
+		if n is not None and n < steps:
+			weight = raw_counts(extend(key, type.argument), steps - 1 - n).get(type.result, 0)
+			options.append((weight, ('abstraction', n, None)))
+	for n in range(steps):
+		arguments = raw_counts(key, n)
+		for argument, count in raw_functions(key, steps - 1 - n).get(type, ()):
+			weight = count * arguments.get(argument, 0)
+			options.append((weight, ('application', n, argument)))
+	kind, n, argument = choose(options, generator)
+	if kind == 'abstraction':
+		body = draw(augment(context, type.argument), extend(key, type.argument), steps - 1 - n, type.result, generator)
+		return Abstraction(type.argument, body)
+	function = draw(context, key, steps - 1 - n, FunctionType(argument, type), generator)
+	return Application(function, draw(context, key, n, argument, generator))
+
+@memoize(DERIVED)
+def distribution(key, steps):
+	'''Types with the given number of steps and the cumulative numbers of their terms'''
+	counts = raw_counts(key, steps)
+	return tuple(counts), tuple(accumulate(counts.values()))
+
+def sample(context, steps, type=None, generator=random):
+	'''Uniformly random term with the given number of steps, of a type if given, with its type'''
+	assert isinstance(steps, int) and steps >= 0
+	key = signature(context)
+	counts = raw_counts(key, steps)
+	if type is None:
+		# The type is drawn by bisection, as there are many more types than choices elsewhere
+		sequence, cumulative = distribution(key, steps)
+		if not sequence:
+			raise Exception('No term with {} steps'.format(steps))
+		type = sequence[bisect_right(cumulative, generator.randrange(cumulative[-1]))]
+	if not counts.get(type):
+		raise Exception('No term of type {} with {} steps'.format(type, steps))
+	return draw(context, key, steps, type, generator), type
+
+def samples(context, steps, type=None, seed=None):
+	'''Endless reproducible stream of uniformly random terms with the given number of steps'''
+	generator = random.Random(seed)
+	while True:
+		yield sample(context, steps, type, generator)
@@ -0,0 +1,73 @@
+import time
+from entities import *
+from generators import goal_level
+from compilers import compile_term
+import metrics
+
+# Synthesis
+# Terms of a target type are enumerated once, smallest first, and each one
+# is checked against every specification that is still unsolved. A
+# specification is a set of input/output examples on natural numbers, and a
+# candidate is rejected at its first failing example, which is then checked
+# first on the next candidates since it is likely to reject them too.
+
+def examples(spec):
+	'''List of (inputs, output) pairs of a specification given as a mapping or a sequence of pairs'''
+	pairs = spec.items() if isinstance(spec, dict) else spec
+	return [
+		(inputs if isinstance(inputs, tuple) else (inputs,), output)
+		for inputs, output in pairs
+	]
+
+def satisfies(function, spec):
+	'''Whether a compiled function matches every example of a specification, moving a failing example to the front'''
+	for k, (inputs, output) in enumerate(spec):
+		result = function
+		for argument in inputs:
+			result = result(argument)
+		if result != output:
+			if k:
+				spec.insert(0, spec.pop(k))
+			return False
+	return True
+
+def synthesize(specs, type, context, steps=None, seconds=None):
+	'''Smallest term of a type matching each specification, found in a single enumeration pass.
+	The search stops once every specification is solved, after the given number
+	of steps, or after the given number of seconds (checked between candidates, so
+	the sub-levels a candidate needs are finished first). Returns one term per
+	specification, or None for those left unsolved.'''
+	assert isinstance(type, Type)
+	specs = [examples(spec) for spec in specs]
+	solutions = [None] * len(specs)
+	unsolved = set(range(len(specs)))
+	deadline = None if seconds is None else time.perf_counter() + seconds
+	def expired():
+		return deadline is not None and time.perf_counter() > deadline
+	candidates = 0
+	level = 0
+	while unsolved and (steps is None or level <= steps) and not expired():
+		for term in goal_level(context, type, level):
+			if expired():
+				break
+			candidates += 1
+			try:
+				function = compile_term(term)
+			except Exception:
+				continue
+			for k in sorted(unsolved):
+				if satisfies(function, specs[k]):
+					solutions[k] = term
+					unsolved.discard(k)
+			if not unsolved:
+				break
+		level += 1
+	if metrics.enabled:
+		metrics.emit(
+			'synthesis',
+			specs=len(specs),
+			solved=sum(solution is not None for solution in solutions),
+			candidates=candidates,
+			steps=level - 1,
+		)
+	return solutions
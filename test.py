@@ -1,7 +1,8 @@
-from itertools import count
 from entities import *
 from generators import *
 from reducers import *
+from synthesis import synthesize
+from machines import normalize_by_machine
 
 natural = BaseType('\u2115')
 
@@ -11,19 +12,6 @@ context = (
 	(Constant('iter'), FunctionType(natural, FunctionType(FunctionType(natural, natural), FunctionType(natural, natural))))
 )
 
-def test(term):
-	for a in range(5):
-		for b in range(5):
-			expression = Application(Application(term, church(a)), church(b))
-			result = unchurch(normalize(expression))
-			if result not in [a * b]:
-				return False
-	return True
-
-
-
-
-
 # Prove that (λ:ℕ (((iter 0) succ) zero)) = (λ:ℕ 0)
 '''
 f = Abstraction(natural, Application(Application(Application(Constant('iter'), Variable(0)), Constant('succ')), Constant('zero')))
@@ -57,28 +45,21 @@ print('Inductively equal: {}\n'.format(inductively_equal(f, t, g, t, log=True)))
 
 
 
-for steps in count():
-	print('{} steps'.format(steps), end=', ')
-	print('{} terms'.format(len(terms(context, steps))))
-	#print('Normal forms: {}'.format(normal_forms(context, steps)))
-
-	for e, t in terms(context, steps):
-		#print('{} ⟶   {}'.format(e, normalize(e)))
-		#continue
-
-		if t == FunctionType(natural, FunctionType(natural, natural)) and test(e):
-			print('Candidate function: {}'.format(e))
-
-		continue
-
-		if t == natural:
-			print(unchurch(normal_form))
-
-		if t == FunctionType(natural, FunctionType(natural, natural)) and isinstance(e, Abstraction) and isinstance(e.body, Abstraction) and isinstance(e.body.body, Application):
-			if str(e) in [
-				'(λ:ℕ (λ:ℕ (((iter 0) (λ:ℕ (((iter 0) succ) 2))) zero)))',
-				'(λ:ℕ (λ:ℕ (((iter 1) (λ:ℕ (((iter 0) succ) 1))) zero)))'
-			]:
-				print('Found multiplication')
-				print(e)
-				print(normalize(e))
+# The machine unfolds iter reached through a variable:
+# (((λ:(ℕ → ((ℕ → ℕ) → (ℕ → ℕ))) 0) iter) zero) = (λ:(ℕ → ℕ) (λ:ℕ 0))
+term = Application(
+	Application(
+		Abstraction(FunctionType(natural, FunctionType(FunctionType(natural, natural), FunctionType(natural, natural))), Variable(0)),
+		Constant('iter')
+	),
+	Constant('zero')
+)
+assert normalize_by_machine(term) == normalize(term)
+
+# Synthesize addition and multiplication in a single pass
+specs = [
+	{(a, b): a + b for a in range(5) for b in range(5)},
+	{(a, b): a * b for a in range(5) for b in range(5)},
+]
+for solution in synthesize(specs, FunctionType(natural, FunctionType(natural, natural)), context):
+	print('Candidate function: {}'.format(solution))
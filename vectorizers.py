@@ -0,0 +1,77 @@
+import numpy
+from entities import *
+
+# Vectorized batch evaluation
+# Natural numbers are int64 arrays over the points of an input grid, and
+# saturate at a limit so that fast-growing candidates neither overflow
+# nor iterate unboundedly. Closed subterms shared between the terms of a
+# batch are evaluated once.
+
+def primitives(limit):
+	'''Array versions of zero, succ and iter saturating at a limit'''
+	def successor(x):
+		return numpy.minimum(x + 1, limit)
+	def iterate(n):
+		n = numpy.minimum(n, limit)
+		def iterate_function(f):
+			def iterate_argument(x):
+				if f is successor:
+					return numpy.minimum(x + n, limit)
+				# Vectorized over the iteration count: each point stops after its own count
+				for k in range(int(numpy.max(n))):
+					x = numpy.where(k < n, f(x), x)
+				return x
+			return iterate_argument
+		return iterate_function
+	return {
+		'zero': numpy.int64(0),
+		'succ': successor,
+		'iter': iterate,
+	}
+
+def vectorize(term, environment, constants, cache):
+	'''Evaluates a term over arrays in an environment tuple'''
+	closed = term.bound == 0
+	if closed and term in cache:
+		return cache[term]
+	if isinstance(term, Constant):
+		if term.name not in constants:
+			raise Exception('Cannot vectorize constant: {}'.format(term))
+		value = constants[term.name]
+	elif isinstance(term, Variable):
+		value = environment[term.index]
+	elif isinstance(term, Abstraction):
+		value = lambda x: vectorize(term.body, (x,) + environment, constants, cache)
+	elif isinstance(term, Application):
+		function = vectorize(term.function, environment, constants, cache)
+		value = function(vectorize(term.argument, environment, constants, cache))
+	if closed:
+		cache[term] = value
+	return value
+
+def evaluate_batch(terms, grid, limit=1 << 12):
+	'''Evaluates closed terms of type (ℕ → ... → ℕ) at every point of a grid.
+	The grid has one row per point and one column per argument. Returns an
+	array with one row per term and one column per point.'''
+	grid = numpy.asarray(grid, dtype=numpy.int64)
+	if grid.ndim == 1:
+		grid = grid[:, numpy.newaxis]
+	points, arity = grid.shape
+	columns = tuple(grid[:, k] for k in range(arity))
+	constants = primitives(limit)
+	cache = {}
+	outputs = numpy.empty((len(terms), points), dtype=numpy.int64)
+	for row, term in enumerate(terms):
+		assert isinstance(term, Term)
+		if term.bound != 0:
+			raise Exception('Cannot vectorize open term: {}'.format(term))
+		value = vectorize(term, (), constants, cache)
+		for column in columns:
+			value = value(column)
+		outputs[row] = value
+	return outputs
+
+def square_grid(size, arity=2):
+	'''Every point of {0, …, size - 1} to the given power, one per row'''
+	axes = numpy.meshgrid(*(numpy.arange(size),) * arity, indexing='ij')
+	return numpy.stack([axis.ravel() for axis in axes], axis=1)